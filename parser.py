@@ -27,500 +27,309 @@ sample test case for exponentiation
 10 / 2 + 3 ^ 2
 5 + 2 ^ 3 ^ 2 - 1
 """
-from enum import Enum
+from enum import IntEnum, auto
 from typing import Any, List, Optional
-import math
+from array import array
+from functools import lru_cache
+from itertools import product
+import operator
+import re
 
 # Token types for our language
-class TokenType(Enum):
+class TokenType(IntEnum):
     # Keywords
-    IF = 'IF'
-    THEN = 'THEN'
-    ELSE = 'ELSE'
+    IF = auto()
+    THEN = auto()
+    ELSE = auto()
     
     # Operators
-    PLUS = 'PLUS'           # +
-    MINUS = 'MINUS'         # -
-    MULTIPLY = 'MULTIPLY'   # *
-    DIVIDE = 'DIVIDE'       # /
-    EXPONENTIATION = 'EXPONENTIATION'         # ^
-    MODULUS = 'MODULUS'     # %
+    PLUS = auto()           # +
+    MINUS = auto()          # -
+    MULTIPLY = auto()       # *
+    DIVIDE = auto()         # /
+    EXPONENTIATION = auto() # ^
+    MODULUS = auto()        # %
     
     # Bitwise operators
-    BITWISE_AND = 'BITWISE_AND' # &
-    BITWISE_OR = 'BITWISE_OR'   # |
+    BITWISE_AND = auto()    # &
+    BITWISE_OR = auto()     # |
     
     # Logical operators
-    AND = 'AND'            # AND
-    OR = 'OR'             # OR
-    NOT = 'NOT'           # NOT
+    AND = auto()            # AND
+    OR = auto()             # OR
+    NOT = auto()            # NOT
     
     # Comparison operators
-    EQUAL = 'EQUAL'       # ==
-    NOT_EQUAL = 'NOT_EQUAL' # !=
-    LESS = 'LESS'         # <
-    GREATER = 'GREATER'   # >
-    LESS_EQUAL = 'LESS_EQUAL' # <=
-    GREATER_EQUAL = 'GREATER_EQUAL' # >=
+    EQUAL = auto()          # ==
+    NOT_EQUAL = auto()      # !=
+    LESS = auto()           # <
+    GREATER = auto()        # >
+    LESS_EQUAL = auto()     # <=
+    GREATER_EQUAL = auto()  # >=
     
     # Other tokens
-    NUMBER = 'NUMBER'
-    LPAREN = 'LPAREN'     # (
-    RPAREN = 'RPAREN'     # )
-    EOF = 'EOF'
-
-class Token:
-    def __init__(self, type: TokenType, value: Any, line: int, column: int):
-        self.type = type
-        self.value = value
-        self.line = line
-        self.column = column
-
-    def __str__(self):
-        return f'Token({self.type}, {self.value}, pos={self.line}:{self.column})'
+    NUMBER = auto()
+    LPAREN = auto()         # (
+    RPAREN = auto()         # )
+    EOF = auto()
+
+def _divide(dividend: float, divisor: float) -> float:
+    if divisor == 0:
+        raise Exception('Division by zero')
+    return dividend / divisor
+
+# Binary operators handled by each parser loop, mapped to their implementation
+_ADDOPS = {
+    TokenType.PLUS: operator.add,
+    TokenType.MINUS: operator.sub
+}
+_MULOPS = {
+    TokenType.MULTIPLY: operator.mul,
+    TokenType.DIVIDE: _divide,
+    TokenType.MODULUS: operator.mod
+}
+_CMPOPS = {
+    TokenType.EQUAL: operator.eq,
+    TokenType.NOT_EQUAL: operator.ne,
+    TokenType.LESS: operator.lt,
+    TokenType.GREATER: operator.gt,
+    TokenType.LESS_EQUAL: operator.le,
+    TokenType.GREATER_EQUAL: operator.ge
+}
+_LOGOPS = frozenset({TokenType.AND, TokenType.OR})
+_ARITHOPS = frozenset({*_ADDOPS, *_MULOPS, TokenType.EXPONENTIATION})
+
+# Every token as one alternation; the named group that matched gives its kind.
+# Character classes are spelled out in ASCII so re tests them against a bitmap
+# rather than the Unicode database. MISMATCH catches any character that cannot
+# start a token.
+_TOKEN_RE = re.compile(r'''
+    (?P<SKIP>[ \t\n\r\f\v]+|\#[^\n]*)
+  | (?P<OP>==|!=|<=|>=|[-+*/^%&|()<>])
+  | (?P<NUMBER>[0-9]+\.?[0-9]*|\.[0-9]+)
+  | (?P<NAME>[A-Za-z][A-Za-z0-9_]*)
+  | (?P<MISMATCH>.)
+''', re.VERBOSE)
 
 class Lexer:
-    def __init__(self, text: str):
-        self.text = text
-        self.pos = 0
-        self.current_char = self.text[0] if text else None
-        self.line = 1
-        self.column = 1
-        
-        # Define keywords
-        self.keywords = {
-            'IF': TokenType.IF,
-            'THEN': TokenType.THEN,
-            'ELSE': TokenType.ELSE,
-            'AND': TokenType.AND,
-            'OR': TokenType.OR,
-            'NOT': TokenType.NOT
-        }
-
-    def error(self):
-        raise Exception(f'Invalid character at line {self.line}, column {self.column}')
-
-    def advance(self):
-        if self.current_char == '\n':
-            self.line += 1
-            self.column = 0
-        self.pos += 1
-        self.column += 1
-        self.current_char = self.text[self.pos] if self.pos < len(self.text) else None
-
-    def skip_whitespace(self):
-        while self.current_char and self.current_char.isspace():
-            self.advance()
-
-    def skip_comment(self):
-        while self.current_char and self.current_char != '\n':
-            self.advance()
-        self.advance()
-
-    def number(self) -> Token:
-        result = ''
-        decimal_point_count = 0
-        
-        while self.current_char and (self.current_char.isdigit() or self.current_char == '.'):
-            if self.current_char == '.':
-                decimal_point_count += 1
-                if decimal_point_count > 1:
-                    self.error()
-            result += self.current_char
-            self.advance()
-            
-        if result.startswith('.'):
-            result = '0' + result
-        if result.endswith('.'):
-            result += '0'
-            
-        return Token(
-            TokenType.NUMBER,
-            float(result),
-            self.line,
-            self.column - len(result)
+    # Operator spellings
+    _OPERATORS = {
+        '+': TokenType.PLUS,
+        '-': TokenType.MINUS,
+        '*': TokenType.MULTIPLY,
+        '/': TokenType.DIVIDE,
+        '^': TokenType.EXPONENTIATION,
+        '%': TokenType.MODULUS,
+        '&': TokenType.BITWISE_AND,
+        '|': TokenType.BITWISE_OR,
+        '(': TokenType.LPAREN,
+        ')': TokenType.RPAREN,
+        '==': TokenType.EQUAL,
+        '!=': TokenType.NOT_EQUAL,
+        '<': TokenType.LESS,
+        '>': TokenType.GREATER,
+        '<=': TokenType.LESS_EQUAL,
+        '>=': TokenType.GREATER_EQUAL
+    }
+
+    # Keywords under every mix of upper and lower case, so an identifier is
+    # looked up exactly as written instead of through an upper-cased copy
+    _KEYWORDS = {
+        ''.join(spelling): token_type
+        for word, token_type in (
+            ('IF', TokenType.IF),
+            ('THEN', TokenType.THEN),
+            ('ELSE', TokenType.ELSE),
+            ('AND', TokenType.AND),
+            ('OR', TokenType.OR),
+            ('NOT', TokenType.NOT)
         )
-
-    def _id(self) -> Token:
-        result = ''
-        while self.current_char and (self.current_char.isalnum() or self.current_char == '_'):
-            result += self.current_char
-            self.advance()
-            
-        token_type = self.keywords.get(result.upper())
-        if token_type:
-            return Token(token_type, result.upper(), self.line, self.column - len(result))
-        self.error()  # Unknown identifier
-
-    def get_next_token(self) -> Token:
-        while self.current_char:
-            if self.current_char.isspace():
-                self.skip_whitespace()
-                continue
-
-            if self.current_char == '#':
-                self.skip_comment()
-                continue
-
-            if self.current_char.isdigit() or self.current_char == '.':
-                return self.number()
-
-            if self.current_char.isalpha():
-                return self._id()
-
-            if self.current_char == '+':
-                self.advance()
-                return Token(TokenType.PLUS, '+', self.line, self.column - 1)
-
-            if self.current_char == '-':
-                self.advance()
-                return Token(TokenType.MINUS, '-', self.line, self.column - 1)
-
-            if self.current_char == '*':
-                self.advance()
-                return Token(TokenType.MULTIPLY, '*', self.line, self.column - 1)
-
-            if self.current_char == '/':
-                self.advance()
-                return Token(TokenType.DIVIDE, '/', self.line, self.column - 1)
-
-            if self.current_char == '^':
-                self.advance()
-                return Token(TokenType.EXPONENTIATION, '^', self.line, self.column - 1)
-
-            if self.current_char == '%':
-                self.advance()
-                return Token(TokenType.MODULUS, '%', self.line, self.column - 1)
-
-            if self.current_char == '&':
-                self.advance()
-                return Token(TokenType.BITWISE_AND, '&', self.line, self.column - 1)
-
-            if self.current_char == '|':
-                self.advance()
-                return Token(TokenType.BITWISE_OR, '|', self.line, self.column - 1)
-
-            if self.current_char == '(':
-                self.advance()
-                return Token(TokenType.LPAREN, '(', self.line, self.column - 1)
-
-            if self.current_char == ')':
-                self.advance()
-                return Token(TokenType.RPAREN, ')', self.line, self.column - 1)
-
-            if self.current_char == '=':
-                self.advance()
-                if self.current_char == '=':
-                    self.advance()
-                    return Token(TokenType.EQUAL, '==', self.line, self.column - 2)
-                self.error()
-
-            if self.current_char == '!':
-                self.advance()
-                if self.current_char == '=':
-                    self.advance()
-                    return Token(TokenType.NOT_EQUAL, '!=', self.line, self.column - 2)
-                self.error()
-
-            if self.current_char == '<':
-                self.advance()
-                if self.current_char == '=':
-                    self.advance()
-                    return Token(TokenType.LESS_EQUAL, '<=', self.line, self.column - 2)
-                return Token(TokenType.LESS, '<', self.line, self.column - 1)
-
-            if self.current_char == '>':
-                self.advance()
-                if self.current_char == '=':
-                    self.advance()
-                    return Token(TokenType.GREATER_EQUAL, '>=', self.line, self.column - 2)
-                return Token(TokenType.GREATER, '>', self.line, self.column - 1)
-
-            self.error()
-
-        return Token(TokenType.EOF, None, self.line, self.column)
+        for spelling in product(*zip(word, word.lower()))
+    }
 
     def __init__(self, text: str):
         self.text = text
         self.pos = 0
-        self.current_char = self.text[0] if text else None
-        self.line = 1
-        self.column = 1
-        
-        # Define keywords
-        self.keywords = {
-            'IF': TokenType.IF,
-            'THEN': TokenType.THEN,
-            'ELSE': TokenType.ELSE,
-            'AND': TokenType.AND,
-            'OR': TokenType.OR,
-            'NOT': TokenType.NOT
-        }
 
-    def error(self):
-        raise Exception(f'Invalid character at line {self.line}, column {self.column}')
-
-    def advance(self):
-        if self.current_char == '\n':
-            self.line += 1
-            self.column = 0
-        self.pos += 1
-        self.column += 1
-        self.current_char = self.text[self.pos] if self.pos < len(self.text) else None
-
-    def skip_whitespace(self):
-        while self.current_char and self.current_char.isspace():
-            self.advance()
-
-    def skip_comment(self):
-        while self.current_char and self.current_char != '\n':
-            self.advance()
-        self.advance()
-
-    def number(self) -> Token:
-        result = ''
-        decimal_point_count = 0
-        
-        while self.current_char and (self.current_char.isdigit() or self.current_char == '.'):
-            if self.current_char == '.':
-                decimal_point_count += 1
-                if decimal_point_count > 1:
-                    self.error()
-            result += self.current_char
-            self.advance()
-            
-        if result.startswith('.'):
-            result = '0' + result
-        if result.endswith('.'):
-            result += '0'
-            
-        return Token(
-            TokenType.NUMBER,
-            float(result),
-            self.line,
-            self.column - len(result)
-        )
-
-    def _id(self) -> Token:
-        result = ''
-        while self.current_char and (self.current_char.isalnum() or self.current_char == '_'):
-            result += self.current_char
-            self.advance()
-            
-        token_type = self.keywords.get(result.upper())
-        if token_type:
-            return Token(token_type, result.upper(), self.line, self.column - len(result))
-        self.error()  # Unknown identifier
-
-    def get_next_token(self) -> Token:
-        while self.current_char:
-            if self.current_char.isspace():
-                self.skip_whitespace()
-                continue
+        # Token buffer, one entry per token in each parallel array
+        self.types = array('B')
+        self.values = array('d')
 
-            if self.current_char == '#':
-                self.skip_comment()
+    def error(self):
+        # Line and column are only needed here, so they are derived from pos
+        line = self.text.count('\n', 0, self.pos) + 1
+        column = self.pos - self.text.rfind('\n', 0, self.pos)
+        raise Exception(f'Invalid character at line {line}, column {column}')
+
+    def tokenize(self):
+        text = self.text
+        types = self.types
+        values = self.values
+
+        for match in _TOKEN_RE.finditer(text):
+            kind = match.lastgroup
+            if kind == 'SKIP':
                 continue
 
-            if self.current_char.isdigit() or self.current_char == '.':
-                return self.number()
-
-            if self.current_char.isalpha():
-                return self._id()
-
-            if self.current_char == '+':
-                self.advance()
-                return Token(TokenType.PLUS, '+', self.line, self.column - 1)
-
-            if self.current_char == '-':
-                self.advance()
-                return Token(TokenType.MINUS, '-', self.line, self.column - 1)
-
-            if self.current_char == '*':
-                self.advance()
-                return Token(TokenType.MULTIPLY, '*', self.line, self.column - 1)
-
-            if self.current_char == '/':
-                self.advance()
-                return Token(TokenType.DIVIDE, '/', self.line, self.column - 1)
-
-            if self.current_char == '^':
-                self.advance()
-                return Token(TokenType.EXPONENTIATION, '^', self.line, self.column - 1)
-
-            if self.current_char == '%':
-                self.advance()
-                return Token(TokenType.MODULUS, '%', self.line, self.column - 1)
-
-            if self.current_char == '&':
-                self.advance()
-                return Token(TokenType.BITWISE_AND, '&', self.line, self.column - 1)
-
-            if self.current_char == '|':
-                self.advance()
-                return Token(TokenType.BITWISE_OR, '|', self.line, self.column - 1)
-
-            if self.current_char == '(':
-                self.advance()
-                return Token(TokenType.LPAREN, '(', self.line, self.column - 1)
-
-            if self.current_char == ')':
-                self.advance()
-                return Token(TokenType.RPAREN, ')', self.line, self.column - 1)
-
-            if self.current_char == '=':
-                self.advance()
-                if self.current_char == '=':
-                    self.advance()
-                    return Token(TokenType.EQUAL, '==', self.line, self.column - 2)
-                self.error()
-
-            if self.current_char == '!':
-                self.advance()
-                if self.current_char == '=':
-                    self.advance()
-                    return Token(TokenType.NOT_EQUAL, '!=', self.line, self.column - 2)
-                self.error()
-
-            if self.current_char == '<':
-                self.advance()
-                if self.current_char == '=':
-                    self.advance()
-                    return Token(TokenType.LESS_EQUAL, '<=', self.line, self.column - 2)
-                return Token(TokenType.LESS, '<', self.line, self.column - 1)
-
-            if self.current_char == '>':
-                self.advance()
-                if self.current_char == '=':
-                    self.advance()
-                    return Token(TokenType.GREATER_EQUAL, '>=', self.line, self.column - 2)
-                return Token(TokenType.GREATER, '>', self.line, self.column - 1)
-
-            self.error()
-
-        return Token(TokenType.EOF, None, self.line, self.column)
+            if kind == 'OP':
+                types.append(self._OPERATORS[match.group()])
+                values.append(0.0)
+            elif kind == 'NUMBER':
+                # A second decimal point (e.g. 1.2.3) is malformed
+                if text.startswith('.', match.end()):
+                    self.pos = match.end()
+                    self.error()
+                types.append(TokenType.NUMBER)
+                values.append(float(match.group()))
+            else:
+                token_type = self._KEYWORDS.get(match.group())
+                if token_type is None:
+                    self.pos = match.start()
+                    self.error()  # Unknown identifier or character
+                types.append(token_type)
+                values.append(0.0)
+
+        self.pos = len(text)
+        types.append(TokenType.EOF)
+        values.append(0.0)
 
 class Parser:
     def __init__(self, lexer: Lexer):
         self.lexer = lexer
-        self.current_token = self.lexer.get_next_token()
+
+        # Lex up front; the parser walks the token arrays with a cursor
+        lexer.tokenize()
+        self.types = lexer.types
+        self.values = lexer.values
+        self.i = 0
 
     def error(self):
         raise Exception('Invalid syntax')
 
     def eat(self, token_type: TokenType):
-        if self.current_token.type == token_type:
-            self.current_token = self.lexer.get_next_token()
+        if self.types[self.i] == token_type:
+            self.i += 1
         else:
             self.error()
 
-    def atom(self) -> float:
-        token = self.current_token
-        if token.type == TokenType.NUMBER:
-            self.eat(TokenType.NUMBER)
-            return token.value
-        elif token.type == TokenType.LPAREN:
-            self.eat(TokenType.LPAREN)
-            result = self.expression()
-            self.eat(TokenType.RPAREN)
-            return result
-        self.error()
-
     def factor(self) -> float:
-        token = self.current_token
-        if token.type == TokenType.PLUS:
-            self.eat(TokenType.PLUS)
+        # <factor>, <exponentiation> and <atom> are parsed in one frame
+        token_type = self.types[self.i]
+        if token_type == TokenType.PLUS:
+            self.i += 1
             return self.factor()
-        elif token.type == TokenType.MINUS:
-            self.eat(TokenType.MINUS)
+        elif token_type == TokenType.MINUS:
+            self.i += 1
             return -self.factor()
-        return self.exponentiation()
+        elif token_type == TokenType.NUMBER:
+            result = self.values[self.i]
+            self.i += 1
+        elif token_type == TokenType.LPAREN:
+            self.i += 1
+            result = self.expression()
+            if self.types[self.i] != TokenType.RPAREN:
+                self.error()
+            self.i += 1
+        else:
+            self.error()
 
-    def exponentiation(self) -> float:
-        result = self.atom()
-        
-        while self.current_token.type == TokenType.EXPONENTIATION:
-            self.eat(TokenType.EXPONENTIATION)
-            result = math.pow(result, self.factor())
+        while self.types[self.i] == TokenType.EXPONENTIATION:
+            self.i += 1
+            result = result ** self.factor()
+            # Unlike math.pow, ** turns a negative base with a fractional
+            # exponent into a complex number; keep rejecting that case
+            if isinstance(result, complex):
+                raise ValueError('math domain error')
             
         return result
 
     def term(self) -> float:
         result = self.factor()
         
-        while self.current_token.type in (TokenType.MULTIPLY, TokenType.DIVIDE, TokenType.MODULUS):
-            token = self.current_token
-            if token.type == TokenType.MULTIPLY:
-                self.eat(TokenType.MULTIPLY)
-                result *= self.factor()
-            elif token.type == TokenType.DIVIDE:
-                self.eat(TokenType.DIVIDE)
-                divisor = self.factor()
-                if divisor == 0:
-                    raise Exception('Division by zero')
-                result /= divisor
-            elif token.type == TokenType.MODULUS:
-                self.eat(TokenType.MODULUS)
-                result %= self.factor()
+        while True:
+            token_type = self.types[self.i]
+            op = _MULOPS.get(token_type)
+            if op is None:
+                break
+            self.i += 1
+            result = op(result, self.factor())
                 
         return result
 
     def expression(self) -> float:
         result = self.term()
         
-        while self.current_token.type in (TokenType.PLUS, TokenType.MINUS):
-            token = self.current_token
-            if token.type == TokenType.PLUS:
-                self.eat(TokenType.PLUS)
-                result += self.term()
-            elif token.type == TokenType.MINUS:
-                self.eat(TokenType.MINUS)
-                result -= self.term()
+        while True:
+            token_type = self.types[self.i]
+            op = _ADDOPS.get(token_type)
+            if op is None:
+                break
+            self.i += 1
+            result = op(result, self.term())
                 
         return result
 
     def comparison(self) -> bool:
         result = self.expression()
         
-        while self.current_token.type in (TokenType.EQUAL, TokenType.NOT_EQUAL, 
-                                        TokenType.LESS, TokenType.GREATER,
-                                        TokenType.LESS_EQUAL, TokenType.GREATER_EQUAL):
-            token = self.current_token
-            if token.type == TokenType.EQUAL:
-                self.eat(TokenType.EQUAL)
-                result = result == self.expression()
-            elif token.type == TokenType.NOT_EQUAL:
-                self.eat(TokenType.NOT_EQUAL)
-                result = result != self.expression()
-            elif token.type == TokenType.LESS:
-                self.eat(TokenType.LESS)
-                result = result < self.expression()
-            elif token.type == TokenType.GREATER:
-                self.eat(TokenType.GREATER)
-                result = result > self.expression()
-            elif token.type == TokenType.LESS_EQUAL:
-                self.eat(TokenType.LESS_EQUAL)
-                result = result <= self.expression()
-            elif token.type == TokenType.GREATER_EQUAL:
-                self.eat(TokenType.GREATER_EQUAL)
-                result = result >= self.expression()
+        while True:
+            token_type = self.types[self.i]
+            op = _CMPOPS.get(token_type)
+            if op is None:
+                break
+            self.i += 1
+            result = op(result, self.expression())
                 
         return result
 
     def logical_expr(self) -> bool:
         result = self.comparison()
         
-        while self.current_token.type in (TokenType.AND, TokenType.OR):
-            token = self.current_token
-            if token.type == TokenType.AND:
-                self.eat(TokenType.AND)
-                result = result and self.comparison()
-            elif token.type == TokenType.OR:
-                self.eat(TokenType.OR)
-                result = result or self.comparison()
+        while self.types[self.i] in _LOGOPS:
+            token_type = self.types[self.i]
+            if token_type == TokenType.AND:
+                self.i += 1
+                if result:
+                    result = self.comparison()
+                else:
+                    self._skip_comparison()
+            elif token_type == TokenType.OR:
+                self.i += 1
+                if result:
+                    self._skip_comparison()
+                else:
+                    result = self.comparison()
                 
         return result
 
+    def _skip_comparison(self):
+        # Move past one <comparison> checking its syntax but evaluating nothing,
+        # for the right-hand side of a short-circuited AND/OR
+        types = self.types
+        i = self.i
+        depth = 0
+        while True:
+            # Operand: unary signs and opening parentheses, then a number
+            while types[i] in _ADDOPS or types[i] == TokenType.LPAREN:
+                if types[i] == TokenType.LPAREN:
+                    depth += 1
+                i += 1
+            if types[i] != TokenType.NUMBER:
+                self.error()
+            i += 1
+
+            # Closing parentheses, then either an operator or the end
+            while depth and types[i] == TokenType.RPAREN:
+                depth -= 1
+                i += 1
+            if types[i] in _ARITHOPS or (not depth and types[i] in _CMPOPS):
+                i += 1
+            elif depth:
+                self.error()
+            else:
+                break
+        self.i = i
+
     def if_expr(self) -> float:
         self.eat(TokenType.IF)
         condition = self.logical_expr()
@@ -532,10 +341,13 @@ class Parser:
         return true_value if condition else false_value
 
     def parse(self):
-        if self.current_token.type == TokenType.IF:
+        if self.types[self.i] == TokenType.IF:
             return self.if_expr()
         return self.logical_expr()
 
+# Expressions have no variables, so a given text always evaluates to the same
+# immutable value; repeated inputs skip lexing and parsing entirely
+@lru_cache(maxsize=1024)
 def evaluate(text: str) -> Any:
     lexer = Lexer(text)
     parser = Parser(lexer)